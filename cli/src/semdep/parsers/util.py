@@ -17,6 +17,7 @@ from base64 import b64decode
 from dataclasses import dataclass
 from pathlib import Path
 from re import escape
+from typing import AbstractSet
 from typing import Any
 from typing import Callable
 from typing import cast
@@ -149,7 +150,9 @@ def triple(p1: Parser[A], p2: Parser[B], p3: Parser[C]) -> Parser[tuple[A, B, C]
     return p1.bind(lambda a: p2.bind(lambda b: p3.bind(lambda c: success((a, b, c)))))
 
 
-def transitivity(manifest_deps: set[A] | None, dep_sources: list[A]) -> Transitivity:
+def transitivity(
+    manifest_deps: AbstractSet[A] | None, dep_sources: list[A]
+) -> Transitivity:
     """
     Computes the transitivity of a package, based on the set of dependencies from a manifest file
     [manifest_deps] can be None in the case where we did not find a manifest file
@@ -336,7 +339,7 @@ def parse_dependency_file(
 
 
 def safe_parse_lockfile_and_manifest(
-    lockfile_to_parse: DependencyFileToParse[A],
+    lockfile_to_parse: DependencyFileToParse[A] | None,
     manifest_to_parse: DependencyFileToParse[B] | None,
 ) -> tuple[A | None, B | None, list[DependencyParserError]]:
     """
@@ -7,10 +7,18 @@ https://classic.yarnpkg.com/lang/en/docs/yarn-lock/
 Version 2/3 parser based on looking at examples on github, I could not find any documentation
 Here are the Yarn 2/3 docs: https://yarnpkg.com/
 """
+import itertools
+import re
+from base64 import b64decode
+from functools import lru_cache
 from pathlib import Path
+from typing import BinaryIO
+from typing import Dict
+from typing import FrozenSet
+from typing import Iterable
+from typing import Iterator
 from typing import List
 from typing import Optional
-from typing import Set
 from typing import Tuple
 from typing import TypeVar
 
@@ -38,6 +46,8 @@ from semgrep.semgrep_interfaces.semgrep_output_v1 import Fpath
 from semgrep.semgrep_interfaces.semgrep_output_v1 import Jsondoc
 from semgrep.semgrep_interfaces.semgrep_output_v1 import Npm
 from semgrep.semgrep_interfaces.semgrep_output_v1 import ScaParserName
+from semgrep.semgrep_interfaces.semgrep_output_v1 import Transitive
+from semgrep.semgrep_interfaces.semgrep_output_v1 import Transitivity
 from semgrep.semgrep_interfaces.semgrep_output_v1 import Yarn1
 from semgrep.semgrep_interfaces.semgrep_output_v1 import Yarn2
 from semgrep.verbose_logging import getLogger
@@ -46,60 +56,8 @@ logger = getLogger(__name__)
 
 A = TypeVar("A")
 
-# The initial line of a yarn version 1 dependency, lists the constraints that lead to this package
-# Examples:
-# "@ampproject/remapping@^2.0.0":
-# bad-lib@0.0.8:
-# my-package-without-version-constraint:
-# "filedep@file:../../correct/path/filedep":
-# "bats@https://github.com/bats-core/bats-core#master":
-part1 = regex('"?@?([^@:]*)', flags=0, group=1)
-part2 = regex('@?([^:,"]*(:?(?!\n)[^:,"]*)*)"?', flags=0, group=1)
-source1 = pair(part1, part2)
-
-# Examples:
-# "@ampproject/remapping@^2.0.0", "@ampproject/remapping@^3.1.0"
-# bad-lib@0.0.8, bad-lib@^0.0.4
-multi_source1 = source1.sep_by(string(", "))
-
-# A key value pair. These can be a name followed by a nested list, but the only data we care about is in outermost list
-# This is why we produce None if the line is preceded by more than 2 spaces, or if it ends in a colon
-# Examples:
-#   version "2.1.1"
-#   integrity sha512-Aolwjd7HSC2PyY0fDj/wA/EimQT4HfEnFYNp5s9CQlrdhyvWTtvZ5YzrUPu6R6/1jKiUlxu8bUhkdSnKHNAHMA==
-#   dependencies:
-key_value1: "Parser[Optional[Tuple[str,str]]]" = (
-    string(" ")
-    .many()
-    .bind(
-        lambda spaces: consume_line
-        if len(spaces) != 2
-        else upto(" ", ":").bind(
-            lambda key: peek(any_char).bind(
-                lambda next: consume_line
-                if next == ":"
-                else string(" ")
-                >> upto("\n").bind(lambda value: success((key, value.strip('"'))))  # type: ignore
-                # mypy seemingly cannot figure out that this function returns an optional
-            )
-        )
-    )
-)
-
-# A full spec of a dependency
-# Examples:
-# "@ampproject/remapping@^2.0.0":
-#   version "2.1.1"
-#   resolved "https://registry.npmjs.org/@ampproject/remapping/-/remapping-2.1.1.tgz"
-#   integrity sha512-Aolwjd7HSC2PyY0fDj/wA/EimQT4HfEnFYNp5s9CQlrdhyvWTtvZ5YzrUPu6R6/1jKiUlxu8bUhkdSnKHNAHMA==
-#   dependencies:
-#     "@jridgewell/trace-mapping" "^0.3.0"
-yarn_dep1 = mark_line(
-    pair(
-        multi_source1 << string(":\n"),
-        key_value1.sep_by(string("\n")).map(lambda xs: {x[0]: x[1] for x in xs if x}),
-    )
-)
+# Shared by every dependency we produce, these are immutable
+NPM_ECOSYSTEM = Ecosystem(Npm())
 
 YARN1_PREFIX = """\
 # THIS IS AN AUTOGENERATED FILE. DO NOT EDIT THIS FILE DIRECTLY.
@@ -107,12 +65,76 @@ YARN1_PREFIX = """\
 
 """
 
-yarn1 = (
-    string(YARN1_PREFIX)
-    >> string("\n").optional()
-    >> yarn_dep1.sep_by(string("\n\n"))
-    << string("\n").optional()
-)
+# What the grammars produce for each dependency: its line number, sources and fields
+ParsedYarnDep = Tuple[int, Tuple[List[Tuple[str, str]], Dict[str, str]]]
+
+
+# Building the grammars is slow and most lockfiles never need them, so this is done lazily
+@lru_cache(maxsize=1)
+def _yarn1_parser() -> "Parser[List[ParsedYarnDep]]":
+    # The initial line of a yarn version 1 dependency, lists the constraints that lead to this package
+    # Examples:
+    # "@ampproject/remapping@^2.0.0":
+    # bad-lib@0.0.8:
+    # my-package-without-version-constraint:
+    # "filedep@file:../../correct/path/filedep":
+    # "bats@https://github.com/bats-core/bats-core#master":
+    part1 = regex('"?@?([^@:]*)', flags=0, group=1)
+    part2 = regex('@?([^:,"]*(:?(?!\n)[^:,"]*)*)"?', flags=0, group=1)
+    source1 = pair(part1, part2)
+
+    # Examples:
+    # "@ampproject/remapping@^2.0.0", "@ampproject/remapping@^3.1.0"
+    # bad-lib@0.0.8, bad-lib@^0.0.4
+    multi_source1 = source1.sep_by(string(", "))
+
+    # A key value pair. These can be a name followed by a nested list, but the only data we care about is in outermost list
+    # This is why we produce None if the line is preceded by more than 2 spaces, or if it ends in a colon
+    # Examples:
+    #   version "2.1.1"
+    #   integrity sha512-Aolwjd7HSC2PyY0fDj/wA/EimQT4HfEnFYNp5s9CQlrdhyvWTtvZ5YzrUPu6R6/1jKiUlxu8bUhkdSnKHNAHMA==
+    #   dependencies:
+    key_value1: "Parser[Optional[Tuple[str,str]]]" = (
+        string(" ")
+        .many()
+        .bind(
+            lambda spaces: consume_line
+            if len(spaces) != 2
+            else upto(" ", ":").bind(
+                lambda key: peek(any_char).bind(
+                    lambda next: consume_line
+                    if next == ":"
+                    else string(" ")
+                    >> upto("\n").bind(lambda value: success((key, value.strip('"'))))  # type: ignore
+                    # mypy seemingly cannot figure out that this function returns an optional
+                )
+            )
+        )
+    )
+
+    # A full spec of a dependency
+    # Examples:
+    # "@ampproject/remapping@^2.0.0":
+    #   version "2.1.1"
+    #   resolved "https://registry.npmjs.org/@ampproject/remapping/-/remapping-2.1.1.tgz"
+    #   integrity sha512-Aolwjd7HSC2PyY0fDj/wA/EimQT4HfEnFYNp5s9CQlrdhyvWTtvZ5YzrUPu6R6/1jKiUlxu8bUhkdSnKHNAHMA==
+    #   dependencies:
+    #     "@jridgewell/trace-mapping" "^0.3.0"
+    yarn_dep1 = mark_line(
+        pair(
+            multi_source1 << string(":\n"),
+            key_value1.sep_by(string("\n")).map(
+                lambda xs: {x[0]: x[1] for x in xs if x}
+            ),
+        )
+    )
+
+    return (
+        string(YARN1_PREFIX)
+        >> string("\n").optional()
+        >> yarn_dep1.sep_by(string("\n\n"))
+        << string("\n").optional()
+    )
 
 
 # The yarn version 2/3 parser is set up equivalently, with slight differences in sub-parsers
@@ -125,66 +147,6 @@ def remove_npm_prefix(s: str) -> str:
         return s
 
 
-# Examples:
-# @ampproject/remapping@npm:^2.0.0
-# @my-scope/my-first-package@my-scope/my-first-package#commit=0b824c650d3a03444dbcf2b27a5f3566f6e41358
-# my-third-package@https://github.com/my-org/my-third-package#everything
-# my-package@file:../../deps/my-local-package::locator=my-project%40workspace%3A.
-# resolve@patch:resolve@^1.1.7#~builtin<compat/resolve>
-source2 = pair(
-    string("@").optional("") + upto("@", consume_other=True),
-    # We remove the "npm:" prefix, because in a package.json, the version constraint will appear without it
-    # e.g. "^1.0.0" in package.json becomes "npm:^1.0.0" in yarn.lock
-    # However, prefix like "file:" *do* appear in package.json, so they aren't removed
-    upto('"', ",").map(remove_npm_prefix),
-)
-
-# Examples:
-# "@apidevtools/json-schema-ref-parser@npm:9.0.9"
-# "@babel/generator@npm:^7.12.11, @babel/generator@npm:^7.12.5, @babel/generator@npm:^7.18.10"
-multi_source2 = quoted(source2.sep_by(string(", ")))
-
-# Examples:
-#   version: 7.18.10
-#   resolution: "@babel/generator@npm:7.18.10"
-#   dependencies:
-key_value2: "Parser[Optional[Tuple[str,str]]]" = (
-    string(" ")
-    .many()
-    .bind(
-        lambda spaces: consume_line
-        if len(spaces) != 2
-        else upto(":").bind(
-            lambda key: string(":")
-            >> peek(any_char).bind(
-                lambda next: success(None)
-                if next == "\n"
-                else string(" ")
-                >> upto("\n").bind(lambda value: success((key, value.strip('"'))))  # type: ignore
-                # mypy seemingly cannot figure out that this function returns an optional
-            )
-        )
-    )
-)
-
-# Examples:
-# "@babel/generator@npm:^7.17.0, @babel/generator@npm:^7.7.2":
-#   version: 7.17.0
-#   resolution: "@babel/generator@npm:7.17.0"
-#   dependencies:
-#     "@babel/types": ^7.17.0
-#     jsesc: ^2.5.1
-#     source-map: ^0.5.0
-#   checksum: 2987dbebb484727a227f1ce3db90810320986cfb3ffd23e6d1d87f75bbd8e7871b5bc44252822d4d5f048a2d872a5702b2a9bf7bab7e07f087d7f306f0ea6c0a
-#   languageName: node
-#   linkType: hard
-yarn_dep2 = mark_line(
-    pair(
-        multi_source2 << string(":\n"),
-        key_value2.sep_by(string("\n")).map(lambda xs: {x[0]: x[1] for x in xs if x}),
-    )
-)
-
 YARN2_PREFIX = """\
 # This file is generated by running "yarn install" inside your project.
 # Manual changes might be lost - proceed with caution!
@@ -195,82 +157,406 @@ __metadata:
   version: \\d+
   cacheKey: \\d+
 """
-yarn2 = (
-    string(YARN2_PREFIX)
-    >> regex(YARN2_METADATA_REGEX).optional()
-    >> string("\n").optional()
-    >> yarn_dep2.sep_by(string("\n\n"))
-    << string("\n").optional()
-)
+
+
+@lru_cache(maxsize=1)
+def _yarn2_parser() -> "Parser[List[ParsedYarnDep]]":
+    # Examples:
+    # @ampproject/remapping@npm:^2.0.0
+    # @my-scope/my-first-package@my-scope/my-first-package#commit=0b824c650d3a03444dbcf2b27a5f3566f6e41358
+    # my-third-package@https://github.com/my-org/my-third-package#everything
+    # my-package@file:../../deps/my-local-package::locator=my-project%40workspace%3A.
+    # resolve@patch:resolve@^1.1.7#~builtin<compat/resolve>
+    source2 = pair(
+        string("@").optional("") + upto("@", consume_other=True),
+        # We remove the "npm:" prefix, because in a package.json, the version constraint will appear without it
+        # e.g. "^1.0.0" in package.json becomes "npm:^1.0.0" in yarn.lock
+        # However, prefix like "file:" *do* appear in package.json, so they aren't removed
+        upto('"', ",").map(remove_npm_prefix),
+    )
+
+    # Examples:
+    # "@apidevtools/json-schema-ref-parser@npm:9.0.9"
+    # "@babel/generator@npm:^7.12.11, @babel/generator@npm:^7.12.5, @babel/generator@npm:^7.18.10"
+    multi_source2 = quoted(source2.sep_by(string(", ")))
+
+    # Examples:
+    #   version: 7.18.10
+    #   resolution: "@babel/generator@npm:7.18.10"
+    #   dependencies:
+    key_value2: "Parser[Optional[Tuple[str,str]]]" = (
+        string(" ")
+        .many()
+        .bind(
+            lambda spaces: consume_line
+            if len(spaces) != 2
+            else upto(":").bind(
+                lambda key: string(":")
+                >> peek(any_char).bind(
+                    lambda next: success(None)
+                    if next == "\n"
+                    else string(" ")
+                    >> upto("\n").bind(lambda value: success((key, value.strip('"'))))  # type: ignore
+                    # mypy seemingly cannot figure out that this function returns an optional
+                )
+            )
+        )
+    )
+
+    # Examples:
+    # "@babel/generator@npm:^7.17.0, @babel/generator@npm:^7.7.2":
+    #   version: 7.17.0
+    #   resolution: "@babel/generator@npm:7.17.0"
+    #   dependencies:
+    #     "@babel/types": ^7.17.0
+    #     jsesc: ^2.5.1
+    #     source-map: ^0.5.0
+    #   checksum: 2987dbebb484727a227f1ce3db90810320986cfb3ffd23e6d1d87f75bbd8e7871b5bc44252822d4d5f048a2d872a5702b2a9bf7bab7e07f087d7f306f0ea6c0a
+    #   languageName: node
+    #   linkType: hard
+    yarn_dep2 = mark_line(
+        pair(
+            multi_source2 << string(":\n"),
+            key_value2.sep_by(string("\n")).map(
+                lambda xs: {x[0]: x[1] for x in xs if x}
+            ),
+        )
+    )
+
+    return (
+        string(YARN2_PREFIX)
+        >> regex(YARN2_METADATA_REGEX).optional()
+        >> string("\n").optional()
+        >> yarn_dep2.sep_by(string("\n\n"))
+        << string("\n").optional()
+    )
+
+
+# The parsy grammars build a tower of closures that every character of the lockfile
+# walks through, which makes them very slow on large lockfiles. Real lockfiles are laid out
+# very regularly, so we scan them line by line instead, producing the same output as the
+# grammars. Anything the scanner is not completely sure about is handed back to the
+# grammars, which remain the reference implementation and produce good errors.
+# The scanner reads raw bytes and only decodes the lines it actually parses, since most
+# lines are nested deeper than anything we look at.
+
+YarnDep = Tuple[int, List[Tuple[str, str]], Dict[str, str]]
+
+# Equivalent to [source1] and [source2] on a single element of a header. Note that like
+# [part1], SOURCE1_REGEX drops the leading @ of scoped packages
+SOURCE1_REGEX = re.compile(r'"?@?([^@:]*)@?([^,"]*)"?')
+SOURCE2_REGEX = re.compile(r'(@?[^@]+)@([^",]+)')
+YARN2_METADATA_PATTERN = re.compile(YARN2_METADATA_REGEX.encode())
+
+
+class UnrecognizedYarnLockfile(Exception):
+    """
+    Raised by the line scanner on input it cannot handle exactly like the parsy grammars
+    """
+
+
+def _parse_source(token: str, yarn_version: int, last: bool) -> Tuple[str, str]:
+    """
+    Split one comma separated element of a dependency header into a (name, constraint) pair,
+    like [source1] or [source2] would. [last] is whether this is the final element of the header
+    """
+    if yarn_version == 1:
+        match = SOURCE1_REGEX.fullmatch(token)
+        # If the name runs to the end of the element, [part1] would keep going into the next one
+        if not match or (match.end(1) == len(token) and not last):
+            raise UnrecognizedYarnLockfile()
+        return match.group(1), match.group(2)
+    else:
+        match = SOURCE2_REGEX.fullmatch(token)
+        if not match:
+            raise UnrecognizedYarnLockfile()
+        constraint = match.group(2)
+        if constraint.startswith("npm:"):
+            constraint = constraint[4:]
+        return match.group(1), constraint
+
+
+def _parse_sources(line: str, yarn_version: int) -> List[Tuple[str, str]]:
+    """
+    Parse the first line of a dependency, like [multi_source1] or [multi_source2]
+    """
+    if yarn_version == 1:
+        if line[0] == " " or not line.endswith(":"):
+            raise UnrecognizedYarnLockfile()
+        header = line[:-1]
+    else:
+        if not (line.startswith('"') and line.endswith('":')):
+            raise UnrecognizedYarnLockfile()
+        header = line[1:-2]
+    tokens = header.split(", ")
+    last = len(tokens) - 1
+    return [
+        _parse_source(token, yarn_version, i == last) for i, token in enumerate(tokens)
+    ]
+
+
+def _parse_field(line: str, yarn_version: int) -> Optional[Tuple[str, str]]:
+    """
+    Parse a line nested under a dependency, like [key_value1] or [key_value2].
+    Produces None for lines we do not care about
+    """
+    if len(line) < 2 or line[1] != " ":
+        # One space of indentation, parsy ignores these lines
+        if line.strip(" "):
+            return None
+        raise UnrecognizedYarnLockfile()
+    if len(line) == 2 or line[2] == " ":
+        # Deeper nesting, such as the contents of a dependencies list
+        if line[-1] != " " or line.strip(" "):
+            return None
+        raise UnrecognizedYarnLockfile()
+    rest = line[2:]
+    if yarn_version == 1:
+        space = rest.find(" ")
+        colon = rest.find(":")
+        if colon != -1 and (space == -1 or colon < space):
+            if colon == 0:
+                raise UnrecognizedYarnLockfile()
+            return None
+        if space < 1 or space == len(rest) - 1:
+            raise UnrecognizedYarnLockfile()
+        return rest[:space], rest[space + 1 :].strip('"')
+    else:
+        key, sep, value = rest.partition(":")
+        if not key or not sep:
+            raise UnrecognizedYarnLockfile()
+        if not value:
+            return None
+        if value[0] != " " or len(value) == 1:
+            raise UnrecognizedYarnLockfile()
+        return key, value[1:].strip('"')
+
+
+def _read_lines(f: BinaryIO) -> Iterator[bytes]:
+    """
+    The lines of a file opened in binary mode, with CRLF line endings turned into LF.
+    Nearly every lockfile only uses LF, which we can check much faster a block at a time
+    than line by line, so only those with carriage returns take the slow path
+    """
+    start = f.tell()
+    has_cr = any(b"\r" in block for block in iter(lambda: f.read(1 << 16), b""))
+    f.seek(start)
+    return _normalize_line_endings(f) if has_cr else iter(f)
+
+
+def _normalize_line_endings(lines: Iterable[bytes]) -> Iterator[bytes]:
+    for line in lines:
+        if line.endswith(b"\r\n"):
+            line = line[:-2] + b"\n"
+        # Any other carriage return would be a newline when reading text, so we give up
+        if b"\r" in line:
+            raise UnrecognizedYarnLockfile()
+        yield line
+
+
+def _scan_yarn(f: BinaryIO, yarn_version: int) -> Iterator[YarnDep]:
+    """
+    Parse a yarn.lock opened in binary mode with a hand written line scanner, one dependency
+    at a time. Produces exactly what [_yarn1_parser] or [_yarn2_parser] would, or raises
+    UnrecognizedYarnLockfile
+    """
+    lines = _read_lines(f)
+    prefix = YARN1_PREFIX if yarn_version == 1 else YARN2_PREFIX
+    prefix_lines = prefix.encode().splitlines(keepends=True)
+    if [next(lines, b"") for _ in prefix_lines] != prefix_lines:
+        raise UnrecognizedYarnLockfile()
+    line_number = len(prefix_lines)
+
+    pending: List[bytes] = []
+    if yarn_version == 2:
+        pending = [next(lines, b"") for _ in range(YARN2_METADATA_REGEX.count("\n"))]
+        if YARN2_METADATA_PATTERN.fullmatch(b"".join(pending)):
+            line_number += len(pending)
+            pending = []
+        else:
+            pending = [line for line in pending if line]
+
+    sources: Optional[List[Tuple[str, str]]] = None
+    fields: Dict[str, str] = {}
+    header_line_number = 0
+    seen_deps = False
+    blank_lines = 0
+    for line_number, line in enumerate(
+        itertools.chain(pending, lines), line_number + 1
+    ):
+        if line.endswith(b"\n"):
+            line = line[:-1]
+        elif not line.startswith(b" ") or (
+            yarn_version == 2 and line.find(b":") == len(line) - 1
+        ):
+            # Without a trailing newline, the grammars reject a final header or a final
+            # key with no value, as they need to look at the next character
+            raise UnrecognizedYarnLockfile()
+
+        if not line:
+            if sources is not None:
+                if header_line_number == line_number - 1:
+                    # The grammars need at least one line between a header and a blank line
+                    raise UnrecognizedYarnLockfile()
+                yield header_line_number, sources, fields
+                sources = None
+                seen_deps = True
+            blank_lines += 1
+        elif sources is None:
+            # Dependencies are separated by exactly one blank line, with at most one
+            # blank line before the first one
+            if blank_lines != 1 and (seen_deps or blank_lines > 1):
+                raise UnrecognizedYarnLockfile()
+            # Lines split at ASCII newlines, so decoding them one at a time replaces the
+            # same invalid bytes as decoding the whole file would
+            sources = _parse_sources(line.decode("utf-8", "replace"), yarn_version)
+            fields = {}
+            header_line_number = line_number
+            blank_lines = 0
+        elif line.startswith(b"   ") and not line.endswith(b" "):
+            # Most lines are nested deeper than the fields we want, such as the entries
+            # of a dependencies list, so skip them without calling _parse_field
+            continue
+        elif line.startswith(b" "):
+            field = _parse_field(line.decode("utf-8", "replace"), yarn_version)
+            if field:
+                fields[field[0]] = field[1]
+        else:
+            raise UnrecognizedYarnLockfile()
+
+    if sources is not None:
+        yield header_line_number, sources, fields
+    elif blank_lines and (seen_deps or blank_lines > 2):
+        raise UnrecognizedYarnLockfile()
 
 
 def get_manifest_deps(
     parsed_manifest: Optional[JSON],
-) -> Optional[Set[Tuple[str, str]]]:
+) -> Optional[Tuple[FrozenSet[str], FrozenSet[Tuple[str, str]]]]:
     """
-    Extract a set of constraints from a package.json file
+    Extract a set of constraints from a package.json file, along with the set of package names
+    they constrain. The names let us rule out most transitive dependencies with a single lookup
     """
-    if not parsed_manifest:
-        return None
     if not parsed_manifest:
         return None
     json = parsed_manifest.as_dict()
     deps = json.get("dependencies")
     if not deps:
-        return set()
-    return {(x[0], x[1].as_str()) for x in deps.as_dict().items()}
+        return frozenset(), frozenset()
+    constraints = frozenset((x[0], x[1].as_str()) for x in deps.as_dict().items())
+    return frozenset(name for name, _ in constraints), constraints
 
 
 def remove_trailing_octothorpe(s: Optional[str]) -> Optional[str]:
     if s is None:
         return None
     else:
-        return "#".join(s.split("#")[:-1]) if "#" in s else s
-
-
-def parse_yarn(
-    lockfile_path: Path, manifest_path: Optional[Path]
-) -> Tuple[List[FoundDependency], List[DependencyParserError]]:
-    with open(lockfile_path) as f:
-        lockfile_text = f.read()
-    yarn_version = 1 if lockfile_text.startswith(YARN1_PREFIX) else 2
-    parser = yarn1 if yarn_version == 1 else yarn2
-    parser_name = (
-        ScaParserName(Yarn1()) if yarn_version == 1 else ScaParserName(Yarn2())
-    )
-    parsed_lockfile, parsed_manifest, errors = safe_parse_lockfile_and_manifest(
-        DependencyFileToParse(lockfile_path, parser, parser_name),
-        DependencyFileToParse(manifest_path, json_doc, ScaParserName(Jsondoc()))
-        if manifest_path
-        else None,
-    )
+        head, octothorpe, _ = s.rpartition("#")
+        return head if octothorpe else s
 
-    if not parsed_lockfile:
-        return [], errors
 
-    manifest_deps = get_manifest_deps(parsed_manifest)
+def _build_found_dependencies(
+    lockfile_path: Path,
+    yarn_version: int,
+    manifest_deps: Optional[Tuple[FrozenSet[str], FrozenSet[Tuple[str, str]]]],
+    lockfile_deps: Iterable[YarnDep],
+) -> List[FoundDependency]:
+    manifest_names = manifest_deps[0] if manifest_deps else frozenset()
+    manifest_constraints = manifest_deps[1] if manifest_deps else None
+    fpath = Fpath(str(lockfile_path))
     output = []
-    for line_number, (sources, fields) in parsed_lockfile:
+    for line_number, sources, fields in lockfile_deps:
         if len(sources) < 1:
             continue
         if "version" not in fields:
             continue
         if yarn_version == 1:
-            allowed_hashes = extract_npm_lockfile_hash(fields.get("integrity"))
+            integrity = fields.get("integrity")
+            # Nearly every integrity field is a single hash, which we can decode directly
+            if (
+                integrity
+                and integrity.startswith(("sha512-", "sha256-", "sha1-"))
+                and integrity.count("-") == 1
+                and " " not in integrity
+            ):
+                algorithm, _, digest = integrity.partition("-")
+                allowed_hashes = {algorithm: [b64decode(digest).hex()]}
+            else:
+                allowed_hashes = extract_npm_lockfile_hash(integrity)
         else:
             checksum = fields.get("checksum")
             allowed_hashes = {"sha512": [checksum]} if checksum else {}
         resolved_url = fields.get("resolved")
+        if manifest_names and not any(name in manifest_names for name, _ in sources):
+            dep_transitivity = Transitivity(Transitive())
+        else:
+            dep_transitivity = transitivity(manifest_constraints, sources)
         output.append(
             FoundDependency(
                 package=sources[0][0],
                 version=fields["version"],
-                ecosystem=Ecosystem(Npm()),
+                ecosystem=NPM_ECOSYSTEM,
                 allowed_hashes=allowed_hashes,
                 resolved_url=remove_trailing_octothorpe(resolved_url),
-                transitivity=transitivity(manifest_deps, sources),
+                transitivity=dep_transitivity,
                 line_number=line_number,
-                lockfile_path=Fpath(str(lockfile_path)),
+                lockfile_path=fpath,
             )
         )
+    return output
+
+
+def _universal_newlines(s: bytes) -> bytes:
+    # Like reading as text would, \r\n and a bare \r both become \n
+    return s.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+
+def parse_yarn(
+    lockfile_path: Path, manifest_path: Optional[Path]
+) -> Tuple[List[FoundDependency], List[DependencyParserError]]:
+    _, parsed_manifest, errors = safe_parse_lockfile_and_manifest(
+        None,
+        DependencyFileToParse(manifest_path, json_doc, ScaParserName(Jsondoc()))
+        if manifest_path
+        else None,
+    )
+    manifest_deps = get_manifest_deps(parsed_manifest)
+
+    with open(lockfile_path, "rb") as f:
+        # Only look at the start of the file to pick a parser, allowing for \r\n line endings
+        head = f.read(len(YARN1_PREFIX) + YARN1_PREFIX.count("\n"))
+        f.seek(0)
+        yarn_version = (
+            1 if _universal_newlines(head).startswith(YARN1_PREFIX.encode()) else 2
+        )
+        # Dependencies are built as they are scanned, so we never hold the whole parse
+        try:
+            output = _build_found_dependencies(
+                lockfile_path, yarn_version, manifest_deps, _scan_yarn(f, yarn_version)
+            )
+            return output, errors
+        except UnrecognizedYarnLockfile:
+            pass
+
+    # Lockfiles the scanner does not recognize go through the grammar, which reports errors
+    parser = _yarn1_parser() if yarn_version == 1 else _yarn2_parser()
+    parser_name = (
+        ScaParserName(Yarn1()) if yarn_version == 1 else ScaParserName(Yarn2())
+    )
+    parsed_lockfile, _, lockfile_errors = safe_parse_lockfile_and_manifest(
+        DependencyFileToParse(lockfile_path, parser, parser_name), None
+    )
+    errors.extend(lockfile_errors)
+    if not parsed_lockfile:
+        return [], errors
+
+    output = _build_found_dependencies(
+        lockfile_path,
+        yarn_version,
+        manifest_deps,
+        (
+            (line_number, sources, fields)
+            for line_number, (sources, fields) in parsed_lockfile
+        ),
+    )
     return output, errors
@@ -0,0 +1,89 @@
+import io
+
+import pytest
+
+from semdep.parsers import yarn
+
+YARN1_LOCKFILE = (
+    yarn.YARN1_PREFIX
+    + """
+"@ampproject/remapping@^2.0.0", "@ampproject/remapping@^2.1.0":
+  version "2.1.1"
+  resolved "https://registry.npmjs.org/@ampproject/remapping/-/remapping-2.1.1.tgz"
+  integrity sha512-Aolwjd7HSC2PyY0fDj/wA/EimQT4HfEnFYNp5s9CQlrdhyvWTtvZ5YzrUPu6R6/1jKiUlxu8bUhkdSnKHNAHMA==
+  dependencies:
+    "@jridgewell/trace-mapping" "^0.3.0"
+
+bad-lib@0.0.8, bad-lib@^0.0.4:
+  version "0.0.8"
+
+my-package-without-version-constraint:
+  version "1.0.0"
+
+"bats@https://github.com/bats-core/bats-core#master":
+  version "1.5.0"
+  resolved "https://codeload.github.com/bats-core/bats-core/tar.gz/172580d2ce19ee33780b5f1df817bbddced43789"
+"""
+)
+
+YARN2_LOCKFILE = (
+    yarn.YARN2_PREFIX
+    + """
+__metadata:
+  version: 6
+  cacheKey: 8
+
+"@babel/generator@npm:^7.17.0, @babel/generator@npm:^7.7.2":
+  version: 7.17.0
+  resolution: "@babel/generator@npm:7.17.0"
+  dependencies:
+    "@babel/types": ^7.17.0
+    jsesc: ^2.5.1
+  checksum: 2987dbebb484727a227f1ce3db90810320986cfb3ffd23e6d1d87f75bbd8e7871b5bc44252822d4d5f048a2d872a5702b2a9bf7bab7e07f087d7f306f0ea6c0a
+  languageName: node
+  linkType: hard
+
+"resolve@patch:resolve@^1.1.7#~builtin<compat/resolve>":
+  version: 1.22.1
+  resolution: "resolve@patch:resolve@npm%3A1.22.1#~builtin<compat/resolve>::version=1.22.1&hash=07638b"
+"""
+)
+
+
+@pytest.mark.quick
+@pytest.mark.parametrize(
+    "text, yarn_version",
+    [
+        (YARN1_LOCKFILE, 1),
+        (YARN1_LOCKFILE.rstrip("\n"), 1),
+        (YARN1_LOCKFILE.replace("\n", "\r\n"), 1),
+        (yarn.YARN1_PREFIX, 1),
+        (YARN2_LOCKFILE, 2),
+        (YARN2_LOCKFILE.replace("\n__metadata:\n  version: 6\n  cacheKey: 8\n", ""), 2),
+    ],
+)
+def test_yarn_scanner_matches_grammar(text: str, yarn_version: int):
+    grammar = yarn._yarn1_parser() if yarn_version == 1 else yarn._yarn2_parser()
+    scanned = yarn._scan_yarn(io.BytesIO(text.encode()), yarn_version)
+    # The grammars are run on text read with universal newlines
+    expected = grammar.parse(text.replace("\r\n", "\n"))
+    assert [(line, (sources, fields)) for line, sources, fields in scanned] == expected
+
+
+@pytest.mark.quick
+@pytest.mark.parametrize(
+    "text, yarn_version",
+    [
+        (YARN1_LOCKFILE + "\n", 1),
+        (YARN1_LOCKFILE.replace("\nbad-lib", "\n\nbad-lib"), 1),
+        (YARN1_LOCKFILE.replace('  version "0.0.8"', "  version"), 1),
+        (YARN1_LOCKFILE.replace('  version "0.0.8"\n', ""), 1),
+        (YARN1_LOCKFILE.replace("\n", "\r"), 1),
+        (YARN2_LOCKFILE.replace("cacheKey: 8", "cacheKey: 10c0"), 2),
+        (YARN2_LOCKFILE.replace('"resolve@patch', "resolve@patch"), 2),
+        ("", 2),
+    ],
+)
+def test_yarn_scanner_rejects_unusual_lockfiles(text: str, yarn_version: int):
+    with pytest.raises(yarn.UnrecognizedYarnLockfile):
+        list(yarn._scan_yarn(io.BytesIO(text.encode()), yarn_version))
@@ -102,6 +102,13 @@ let status_of_run ?quiet cmd =
       (* nosemgrep: forbid-exec *)
       Cmd.bos_apply (Bos.OS.Cmd.run_status ?quiet) cmd)
 
+(* Only looks the command up in the PATH, without running it *)
+let exists cmd =
+  (* nosemgrep: forbid-exec *)
+  match Cmd.bos_apply Bos.OS.Cmd.exists cmd with
+  | Ok exists -> exists
+  | Error _ -> false
+
 (* TODO: switch to type Cmd.t for cmd *)
 let with_open_process_in (cmd : string) f =
   log_shell_command cmd;
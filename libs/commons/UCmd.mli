@@ -18,6 +18,9 @@ val lines_of_run :
 val status_of_run :
   ?quiet:bool -> Cmd.t -> (Bos.OS.Cmd.status, [> Rresult.R.msg ]) result
 
+(* Whether the command can be found in the PATH. This does not run it. *)
+val exists : Cmd.t -> bool
+
 val with_open_process_in : string -> (in_channel -> 'a) -> 'a
 
 (* old style *)
@@ -79,8 +79,12 @@ let get_new_branch () : string =
   let version = "v1" in
   Printf.sprintf "semgrep/install-ci-%s" version
 
+(* We just try to create the directory: checking whether it exists first
+ * costs an extra stat and races with anything else creating it.
+ *)
 let mkdir_if_needed path : unit =
-  if not (Sys.file_exists path) then Unix.mkdir path 0o777
+  try Unix.mkdir path 0o777 with
+  | Unix.Unix_error (Unix.EEXIST, _, _) -> ()
 
 (*****************************************************************************)
 (* gh (github CLI) setup *)
@@ -94,8 +98,9 @@ let install_gh_cli () : unit =
      their own platform-specific instructions at https://github.com/cli/cli#installation
   *)
   let cmd = (Cmd.Name "brew", [ "install"; "github" ]) in
+  (* bugfix: was Ok _, but brew failing still gives us an Ok `Exited n *)
   match UCmd.status_of_run cmd with
-  | Ok _ -> Logs.app (fun m -> m "Github cli installed successfully")
+  | Ok (`Exited 0) -> Logs.app (fun m -> m "Github cli installed successfully")
   | _ ->
       Logs.err (fun m ->
           m "%s Github cli failed to install" (Console.error_tag ()));
@@ -109,14 +114,11 @@ let install_gh_cli () : unit =
            "https://github.com/cli/cli#installation")
 
 let gh_cli_exists () : bool =
-  (* 'command' can be used to test the presence of another command
-   * see https://askubuntu.com/questions/512770/what-is-the-bash-command-command
+  (* We just look for gh in the PATH. This used to spawn 'command -v gh',
+   * but 'command' is a shell builtin, and all we need is the lookup.
    * alt: run gh --version and check for exit code
    *)
-  let cmd = (Cmd.Name "command", [ "-v"; "gh" ]) in
-  match UCmd.status_of_run cmd with
-  | Ok _ -> true
-  | _ -> false
+  UCmd.exists (Cmd.Name "gh", [])
 
 let install_gh_cli_if_needed () : unit =
   if gh_cli_exists () then
@@ -127,14 +129,19 @@ let install_gh_cli_if_needed () : unit =
 
 let gh_authed () : bool =
   let cmd = (Cmd.Name "gh", [ "auth"; "status" ]) in
-  match UCmd.status_of_run cmd with
-  | Ok _ -> true
+  (* we only care about the exit code, not the account details *)
+  match UCmd.status_of_run ~quiet:true cmd with
+  | Ok (`Exited 0) -> true
   | _ -> false
 
 let prompt_gh_auth () : unit =
   let cmd = (Cmd.Name "gh", [ "auth"; "login"; "--web" ]) in
   match UCmd.status_of_run cmd with
-  | _ -> ()
+  | Ok (`Exited 0) -> ()
+  | _ ->
+      Logs.err (fun m ->
+          m "%s Github cli failed to authenticate" (Console.error_tag ()));
+      Error.abort "Please log in manually with 'gh auth login'"
 
 let prompt_gh_auth_if_needed () : unit =
   if gh_authed () then
@@ -223,13 +230,23 @@ let merge_pr () : unit =
       Error.abort "Failed to merge PR. Please merge manually"
 
 let semgrep_app_token_secret_exists ~git_dir:dir : bool =
+  (* When not writing to a terminal, gh lists one secret per line with
+   * tab-separated fields, the name first. We compare the name exactly,
+   * rather than matching a prefix, so that e.g. SEMGREP_APP_TOKEN_OLD
+   * does not count.
+   *)
   let cmd = (Cmd.Name "gh", [ "secret"; "list"; "-a"; "actions" ]) in
+  let is_token line =
+    match String.split_on_char '\t' line with
+    | name :: _ -> String.trim name = "SEMGREP_APP_TOKEN"
+    | [] -> false
+  in
   match
     Bos.OS.Dir.with_current dir
       (fun () ->
         match UCmd.lines_of_run ~trim:true cmd with
-        | Ok (lines, _status) ->
-            List.exists (String.starts_with ~prefix:"SEMGREP_APP_TOKEN") lines
+        (* a failed listing must not look like the secret is missing *)
+        | Ok (lines, (_, `Exited 0)) -> List.exists is_token lines
         | _ ->
             Logs.warn (fun m -> m "Failed to list secrets for %s" !!dir);
             Error.abort
@@ -269,25 +286,39 @@ let add_semgrep_gh_secret ~git_dir:dir ~(token : Auth.token) : unit =
 (*****************************************************************************)
 (* TODO? add in Git_wrapper.ml instead? *)
 
-let get_default_branch () : string =
-  let cmd =
-    (Cmd.Name "git", [ "symbolic-ref"; "refs/remotes/origin/HEAD"; "--short" ])
-  in
-  match UCmd.string_of_run ~trim:true cmd with
-  | Ok (s, _status) -> s
-  | _ ->
-      Logs.warn (fun m -> m "Failed to get default branch");
-      "origin/main"
+(* 'git clone' records the default branch of origin as a symbolic ref,
+ * stored as a one-line file which we can read without running git.
+ * This is not always there (e.g., in a worktree .git is a file), in which
+ * case we return None and ask git instead.
+ *)
+let read_default_branch () : string option =
+  let head_file = Fpath.v ".git/refs/remotes/origin/HEAD" in
+  let prefix = "ref: refs/remotes/" in
+  if UFile.is_file head_file then
+    match UFile.cat head_file with
+    | [ line ]
+      when String.starts_with ~prefix line
+           && String.length line > String.length prefix ->
+        (* same as 'git symbolic-ref --short', e.g. "origin/main" *)
+        Some
+          (String.sub line (String.length prefix)
+             (String.length line - String.length prefix))
+    | _ -> None
+  else None
 
-let get_default_branch_in ~dst : string =
-  let default = "origin/main" in
-  let res = Bos.OS.Dir.with_current dst (fun () -> get_default_branch ()) () in
-  match res with
-  | Ok branch -> branch
-  | _ ->
-      Logs.warn (fun m ->
-          m "Failed to get default branch in %s, defaulting to %s" !!dst default);
-      default
+let get_default_branch () : string =
+  match read_default_branch () with
+  | Some branch -> branch
+  | None -> (
+      let cmd =
+        ( Cmd.Name "git",
+          [ "symbolic-ref"; "refs/remotes/origin/HEAD"; "--short" ] )
+      in
+      match UCmd.string_of_run ~trim:true cmd with
+      | Ok (s, _status) -> s
+      | _ ->
+          Logs.warn (fun m -> m "Failed to get default branch");
+          "origin/main")
 
 let add_all_to_git () : unit =
   let cmd = (Cmd.Name "git", [ "add"; "." ]) in
@@ -331,19 +362,23 @@ let git_commit () : unit =
  * or version
  *)
 let semgrep_workflow_exists ~repo : bool =
-  let dir, cmd =
-    if UFile.dir_exists repo then
-      ( Fpath.to_dir_path repo,
-        (Cmd.Name "gh", [ "workflow"; "view"; "semgrep.yml" ]) )
+  let res =
+    if UFile.dir_exists repo then (
+      let dir = Fpath.to_dir_path repo in
+      let cmd = (Cmd.Name "gh", [ "workflow"; "view"; "semgrep.yml" ]) in
+      Logs.debug (fun m -> m "Checking for semgrep workflow from %s" !!dir);
+      Bos.OS.Dir.with_current dir (fun () -> UCmd.status_of_run cmd) ())
     else
-      ( Bos.OS.Dir.current () |> Rresult.R.get_ok,
+      (* gh is told which repo to look at, so there is no need to chdir *)
+      let cmd =
         (Cmd.Name "gh", [ "workflow"; "view"; "semgrep.yml"; "--repo"; !!repo ])
-      )
+      in
+      Logs.debug (fun m -> m "Checking for semgrep workflow in %s" !!repo);
+      Ok (UCmd.status_of_run cmd)
   in
-  Logs.debug (fun m -> m "Checking for semgrep workflow from %s" !!dir);
-  let res = Bos.OS.Dir.with_current dir (fun () -> UCmd.status_of_run cmd) () in
   match res with
-  | Ok (Ok _) -> true
+  (* bugfix: was Ok (Ok _), but "not found" still gives us an Ok `Exited n *)
+  | Ok (Ok (`Exited 0)) -> true
   | _else_ -> false
 
 (* NOTE: If the repo is not checked out locally,
@@ -371,11 +406,14 @@ let prep_repo (caps : caps) (repo : Fpath.t) : Fpath.t =
     tmp_dir / repo
 
 let write_workflow_file (caps : < Cap.chdir ; Cap.tmp >) ~git_dir:dir : unit =
-  let commit = get_default_branch_in ~dst:dir in
-  Logs.debug (fun m -> m "Using '%s' as default branch." commit);
+  (* we get the default branch from within the same chdir as the rest
+   * of the work, rather than going in and out of dir once more for it
+   *)
   let res =
     Bos.OS.Dir.with_current dir
       (fun () ->
+        let commit = get_default_branch () in
+        Logs.debug (fun m -> m "Using '%s' as default branch." commit);
         Git_wrapper.run_with_worktree caps ~commit ~branch:(get_new_branch ())
           (fun () ->
             let github_dir = ".github" in